@@ -1,14 +1,55 @@
 import os
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import aiohttp
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from dotenv import load_dotenv
+from numba import njit
 from typing import List, Dict, Any, Optional, Tuple
-import time
 
 # Load environment variables (e.g. ODDS_API_KEY) from a .env file.
 load_dotenv()
 
 
+@njit(cache=True, nogil=True)
+def _arb_kernel(ih: np.ndarray, ia: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Scans every (home, away) pair given the reciprocal odds arrays ih = 1/h and ia = 1/a, and returns parallel
+    arrays (i, j, profit_percent) for the pairs where ih[i] + ia[j] < 1, excluding i == j.
+    Taking reciprocals as inputs keeps the inner loop a pure add; the k^2 divisions are hoisted to k by the caller.
+    Compiled with Numba so the tight float loop runs as native code; cache=True persists the compilation across runs,
+    and nogil=True releases the GIL while the kernel runs so events can be scanned on multiple threads.
+    """
+    n = ih.shape[0]
+    out_i = np.empty(n * n, dtype=np.int64)
+    out_j = np.empty(n * n, dtype=np.int64)
+    out_p = np.empty(n * n, dtype=np.float64)
+    count = 0
+    for i in range(n):
+        inv_h = ih[i]
+        for j in range(n):
+            if i == j:
+                continue
+            arb_sum = inv_h + ia[j]
+            if arb_sum < 1.0:
+                out_i[count] = i
+                out_j[count] = j
+                out_p[count] = (1.0 / arb_sum - 1.0) * 100.0
+                count += 1
+    return out_i[:count], out_j[:count], out_p[:count]
+
+
 class ArbitrageCalculator:
     """
     A helper class to compute arbitrage opportunities given a list of odds dictionaries.
@@ -16,53 +57,76 @@ class ArbitrageCalculator:
     """
 
     @staticmethod
-    def compute_arbitrage(odds_list: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def compute_all(odds: pd.DataFrame, max_opportunities: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Compute arbitrage opportunity (if any) from a list of odds dictionaries.
-        Each dict is expected to have keys: 'sport', 'home_team', 'away_team', 'bookmaker', 'home_odds', 'away_odds'.
-        Returns a dict with arbitrage details (sport, home_team, away_team, home_bookmaker, away_bookmaker, home_odds, away_odds, profit_percent) if an arbitrage is found, else None.
+        Compute all arbitrage opportunities from a DataFrame of odds.
+        The DataFrame is expected to have columns: 'sport', 'home_team', 'away_team', 'bookmaker', 'home_odds', 'away_odds'.
+        If max_opportunities is given, the scan stops once that many opportunities have been found; the cap counts
+        results rather than input rows, so events with many bookmakers are never truncated mid-event.
+        Returns a list of dicts with arbitrage details (sport, home_team, away_team, home_bookmaker, away_bookmaker, home_odds, away_odds, profit_percent); the list is empty if no arbitrage is found.
         """
-        if not odds_list:
-            return None
+        if odds.empty:
+            return []
 
-        # Group odds by sport, home_team, away_team (i.e. by event) so that we compare odds for the same event.
-        event_odds: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
-        for odd in odds_list:
-            key = (odd["sport"], odd["home_team"], odd["away_team"])
-            if key not in event_odds:
-                event_odds[key] = []
-            event_odds[key].append(odd)
+        # Pre-reduce each bookmaker to its best (highest) quote on each side in one pass over the whole frame:
+        # arbitrage only ever uses a bookmaker's best odds, and doing this up front keeps the per-event loop free
+        # of the groupby/agg it used to rebuild (and whose column spec it re-resolved) on every iteration.
+        # pandas' C-level hash grouper is much faster than a tuple-keyed Python dict; sort=False skips an unneeded sort pass.
+        best = odds.groupby(["sport", "home_team", "away_team", "bookmaker"], sort=False).agg(
+            h=("home_odds", "max"), a=("away_odds", "max")).reset_index(level="bookmaker")
 
+        events = []
+        # Group by sport, home_team, away_team (i.e. by event) so that we compare odds for the same event.
+        for (sport, home, away), per_book in best.groupby(["sport", "home_team", "away_team"], sort=False):
+            # An event quoted by a single bookmaker can never arbitrage (needs two distinct entries).
+            if len(per_book) < 2:
+                continue
+            bookmakers = per_book["bookmaker"].values
+            h = per_book["h"].values.astype(np.float64)
+            a = per_book["a"].values.astype(np.float64)
+            # Take the reciprocals once per column; everything downstream (early reject and kernel) only adds them.
+            with np.errstate(divide="ignore"):
+                ih = 1.0 / h
+                ia = 1.0 / a
+            # Early reject: the reciprocal is smallest at the best (highest) odds on each side,
+            # so if even that combination is >= 1 the whole matrix is dead and we skip the pair scan.
+            if ih.min() + ia.min() >= 1.0:
+                continue
+            events.append((sport, home, away, bookmakers, h, a, ih, ia))
+
+        # Each surviving event is independent, so scan them across a thread pool. The kernel releases the
+        # GIL (nogil=True), so the threads genuinely run the pair scans in parallel.
         arbitrage_opportunities = []
-        for (sport, home, away), odds_group in event_odds.items():
-            # For each event, compare home_odds (from one bookmaker) and away_odds (from another bookmaker).
-            for i, odd1 in enumerate(odds_group):
-                for odd2 in odds_group[i + 1:]:
-                    # odd1: home_odds (decimal) from bookmaker odd1["bookmaker"]
-                    # odd2: away_odds (decimal) from bookmaker odd2["bookmaker"]
-                    home_odds = odd1["home_odds"]
-                    away_odds = odd2["away_odds"]
-                    # Arbitrage exists if (1/home_odds + 1/away_odds) < 1.
-                    arb_sum = (1.0 / home_odds) + (1.0 / away_odds)
-                    if arb_sum < 1.0:
-                        profit_percent = (1.0 / arb_sum - 1.0) * 100.0
-                        arb_dict = {
-                            "sport": sport,
-                            "home_team": home,
-                            "away_team": away,
-                            "home_bookmaker": odd1["bookmaker"],
-                            "away_bookmaker": odd2["bookmaker"],
-                            "home_odds": home_odds,
-                            "away_odds": away_odds,
-                            "profit_percent": profit_percent
-                        }
-                        arbitrage_opportunities.append(arb_dict)
-
-        if arbitrage_opportunities:
-            # Arbitrarily return the first arbitrage opportunity found.
-            return arbitrage_opportunities[0]
-        else:
-            return None
+        with ThreadPoolExecutor() as ex:
+            for event_opportunities in ex.map(ArbitrageCalculator._scan_event, events):
+                arbitrage_opportunities.extend(event_opportunities)
+                # Optional safety cap: stop collecting once enough opportunities were found.
+                if max_opportunities is not None and len(arbitrage_opportunities) >= max_opportunities:
+                    return arbitrage_opportunities[:max_opportunities]
+
+        return arbitrage_opportunities
+
+    @staticmethod
+    def _scan_event(event: Tuple) -> List[Dict[str, Any]]:
+        """
+        Scans one event (already reduced to per-bookmaker best odds) with the compiled kernel
+        (arbitrage exists if 1/home_odds + 1/away_odds < 1) and returns its opportunity dicts.
+        """
+        sport, home, away, bookmakers, h, a, ih, ia = event
+        idx_i, idx_j, profits = _arb_kernel(ih, ia)
+        opportunities = []
+        for i, j, profit_percent in zip(idx_i, idx_j, profits):
+            opportunities.append({
+                "sport": sport,
+                "home_team": home,
+                "away_team": away,
+                "home_bookmaker": bookmakers[i],
+                "away_bookmaker": bookmakers[j],
+                "home_odds": float(h[i]),
+                "away_odds": float(a[j]),
+                "profit_percent": float(profit_percent)
+            })
+        return opportunities
 
 
 class Fetch:
@@ -74,80 +138,236 @@ class Fetch:
     # Class variable to cache sports (so that fetch_sports() is called only once per session).
     _cached_sports: Optional[List[str]] = None
 
+    # On-disk cache for the sports list (survives process restarts); refreshed once older than the TTL.
+    _SPORTS_CACHE_FILE = Path.home() / ".cache" / "arb_bot" / "sports.json"
+    _SPORTS_CACHE_TTL = 24 * 60 * 60  # seconds
+
+    # Back off once the API reports fewer remaining requests than this.
+    _RATE_LIMIT_THRESHOLD = 20
+
+    # Transient statuses worth retrying, and the bounds of the jittered exponential backoff (seconds).
+    _RETRY_STATUS = {429, 500, 502, 503, 504}
+    _BACKOFF_BASE = 0.5
+    _BACKOFF_CAP = 30.0
+
     def __init__(self):
         self.api_key = os.getenv("ODDS_API_KEY")
         if not self.api_key:
             raise ValueError("ODDS_API_KEY not found in environment variables.")
         self.sports_url = "https://api.the-odds-api.com/v4/sports"
         self.odds_url = "https://api.the-odds-api.com/v4/sports/{sport}/odds/?apiKey={apiKey}&regions=us,us2"
-        # A list to store raw odds data (each entry is a dict with keys: sport, home_team, away_team, bookmaker, home_odds, away_odds).
-        self.odds_data: List[Dict[str, Any]] = []
+        # Raw odds data stored as parallel columns (struct-of-arrays) instead of a list of per-row dicts:
+        # far fewer allocations, and the columns feed the DataFrame / NumPy kernel directly.
+        self._sport: List[str] = []
+        self._home: List[str] = []
+        self._away: List[str] = []
+        self._book: List[str] = []
+        self._home_odds: List[float] = []
+        self._away_odds: List[float] = []
+        # Intern table for strings parsed from the odds JSON. There are only a handful of distinct sports,
+        # teams and bookmakers, so sharing one instance per value shrinks the columns and makes the
+        # downstream groupby keys pointer-equal (cached hash, pointer compare).
+        self._intern: Dict[str, str] = {}
+        # Adaptive delay (seconds) before each odds request; stays 0 until the API reports its quota is running low.
+        self._delay: float = 0.0
+        # Session for the synchronous calls, so the TCP/TLS connection is reused across requests.
+        # The mounted adapter pools connections and retries 5xx at the transport level;
+        # 429 is left to _get_with_retry, which knows about the API's rate-limit headers.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def _update_rate_limit(self, headers: Any) -> None:
+        """
+        Adjusts the adaptive delay from the Odds API quota headers (x-requests-remaining / x-requests-used).
+        While plenty of quota remains the delay stays 0; once the remaining count drops below the threshold, requests are paced 1 s apart.
+        """
+        remaining = headers.get("x-requests-remaining")
+        if remaining is None:
+            return
+        try:
+            remaining = float(remaining)
+        except ValueError:
+            return
+        if remaining < Fetch._RATE_LIMIT_THRESHOLD:
+            self._delay = max(self._delay, 1.0)
+        else:
+            self._delay = 0.0
+
+    def _i(self, s: str) -> str:
+        """
+        Interns a string: returns the one shared instance for s, so repeated JSON reads reuse the same object.
+        """
+        return self._intern.setdefault(s, s)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """
+        Returns a "full jitter" exponential backoff delay for the given (0-based) attempt: uniform in [0, min(cap, base * 2**attempt)].
+        """
+        return random.uniform(0.0, min(Fetch._BACKOFF_CAP, Fetch._BACKOFF_BASE * (2 ** attempt)))
+
+    def _get_with_retry(self, url: str, label: str, max_tries: int = 5) -> Optional[requests.Response]:
+        """
+        GETs a URL, retrying transient failures (429/5xx or connection errors) with jittered exponential backoff.
+        Returns the final response, or None if every try failed with a request error.
+        """
+        response = None
+        for attempt in range(max_tries):
+            try:
+                response = self._session.get(url, timeout=10)
+            except requests.exceptions.RequestException as e:
+                print(f"Request error fetching {label}: {e}; retrying.")
+                time.sleep(self._backoff(attempt))
+                continue
+            self._update_rate_limit(response.headers)
+            if response.status_code not in Fetch._RETRY_STATUS:
+                return response
+            print(f"Transient error fetching {label}: status code {response.status_code}; retrying.")
+            time.sleep(self._backoff(attempt))
+        return response
+
+    async def _get_json_with_retry(self, session: aiohttp.ClientSession, url: str, label: str, max_tries: int = 5) -> Optional[Any]:
+        """
+        GETs a URL asynchronously and returns the parsed JSON body, retrying transient failures
+        (429/5xx or connection errors) with jittered exponential backoff. On 429 the Retry-After header
+        takes precedence over the jitter. Returns None if every try failed.
+        """
+        for attempt in range(max_tries):
+            # Pace ourselves only when the API has reported that its quota is running low.
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            try:
+                async with session.get(url) as response:
+                    self._update_rate_limit(response.headers)
+                    if response.status == 200:
+                        # orjson parses the raw bytes several times faster than the stdlib json used by response.json().
+                        return orjson.loads(await response.read())
+                    if response.status not in Fetch._RETRY_STATUS:
+                        print(f"Error fetching {label}: status code {response.status}.")
+                        return None
+                    if response.status == 429 and "Retry-After" in response.headers:
+                        backoff = float(response.headers["Retry-After"])
+                    else:
+                        backoff = self._backoff(attempt)
+                    print(f"Transient error fetching {label}: status code {response.status}; retrying in {backoff:.1f} s.")
+            except aiohttp.ClientError as e:
+                backoff = self._backoff(attempt)
+                print(f"Request error fetching {label}: {e}; retrying in {backoff:.1f} s.")
+            await asyncio.sleep(backoff)
+        print(f"Giving up fetching {label} after {max_tries} tries.")
+        return None
 
     def fetch_sports(self) -> List[str]:
         """
         Fetches a list of available sports (keys) from the Odds API.
-        Uses a class-level cache (_cached_sports) to avoid repeated requests.
+        Uses a class-level cache (_cached_sports) to avoid repeated requests within a process,
+        and an on-disk JSON cache (with a 24 h TTL) to avoid re-fetching across process restarts.
         """
         if Fetch._cached_sports is not None:
             return Fetch._cached_sports
 
+        # Try the on-disk cache next; the sports list changes rarely, so a fresh file saves an API call per run.
+        cache_file = Fetch._SPORTS_CACHE_FILE
+        try:
+            if cache_file.exists() and time.time() - cache_file.stat().st_mtime < Fetch._SPORTS_CACHE_TTL:
+                sports = json.loads(cache_file.read_text())
+                Fetch._cached_sports = sports
+                return sports
+        except (OSError, ValueError) as e:
+            print(f"Could not read the sports cache file: {e}.")
+
         sports = []
         try:
-            response = requests.get(f"{self.sports_url}?api_key={self.api_key}")
-            if response.status_code == 200:
-                for sport in response.json():
+            response = self._get_with_retry(f"{self.sports_url}?api_key={self.api_key}", "sports")
+            if response is None:
+                print("Error fetching sports: all retries failed.")
+            elif response.status_code == 200:
+                for sport in orjson.loads(response.content):
                     sports.append(sport["key"])
                 Fetch._cached_sports = sports
+                try:
+                    cache_file.parent.mkdir(parents=True, exist_ok=True)
+                    cache_file.write_text(json.dumps(sports))
+                except OSError as e:
+                    print(f"Could not write the sports cache file: {e}.")
             else:
                 print(f"Error fetching sports: status code {response.status_code}.")
-        except requests.exceptions.RequestException as e:
-            print(f"Request error fetching sports: {e}.")
         except Exception as e:
             print(f"Unexpected error fetching sports: {e}.")
         return sports
 
-    def fetch_odds(self, sport: str) -> None:
+    async def fetch_odds_async(self, session: aiohttp.ClientSession, sport: str) -> None:
         """
-        Fetches odds for a given sport from the Odds API and appends the parsed odds (home/away) into self.odds_data.
+        Fetches odds for a given sport from the Odds API (asynchronously) and appends the parsed odds (home/away) into the odds columns.
         """
         url = self.odds_url.format(sport=sport, apiKey=self.api_key)
         try:
-            response = requests.get(url)
-            if response.status_code != 200:
-                print(f"Error fetching odds for sport {sport}: status code {response.status_code}.")
+            data = await self._get_json_with_retry(session, url, f"odds for sport {sport}")
+            if data is None:
                 return
-            data = response.json()
+            sport = self._i(sport)
             for game in data:
-                home_team = game.get("home_team", "N/A")
-                away_team = game.get("away_team", "N/A")
+                home_team = self._i(game.get("home_team", "N/A"))
+                away_team = self._i(game.get("away_team", "N/A"))
                 for book in game.get("bookmakers", []):
-                    bookmaker = book.get("key", "N/A")
+                    bookmaker = self._i(book.get("key", "N/A"))
                     for market in book.get("markets", []):
                         if market.get("key") == "h2h":
-                            for outcome in market.get("outcomes", []):
-                                if outcome.get("name") == home_team:
-                                    home_odds = outcome.get("price", 0.0)
-                                elif outcome.get("name") == away_team:
-                                    away_odds = outcome.get("price", 0.0)
-                            # Append a dict with keys: sport, home_team, away_team, bookmaker, home_odds, away_odds.
-                            self.odds_data.append({
-                                "sport": sport,
-                                "home_team": home_team,
-                                "away_team": away_team,
-                                "bookmaker": bookmaker,
-                                "home_odds": home_odds,
-                                "away_odds": away_odds
-                            })
-        except requests.exceptions.RequestException as e:
-            print(f"Request error fetching odds for sport {sport}: {e}.")
+                            # Map outcome name -> price once; the old if/elif scan kept iterating after both
+                            # sides were found and left home_odds/away_odds unbound (or stale from the previous
+                            # market) when an outcome was missing.
+                            by_name = {o.get("name"): o.get("price", 0.0) for o in market.get("outcomes", [])}
+                            home_odds = by_name.get(home_team, 0.0)
+                            away_odds = by_name.get(away_team, 0.0)
+                            # Append one row across the parallel columns.
+                            self._sport.append(sport)
+                            self._home.append(home_team)
+                            self._away.append(away_team)
+                            self._book.append(bookmaker)
+                            self._home_odds.append(home_odds)
+                            self._away_odds.append(away_odds)
         except Exception as e:
             print(f"Unexpected error fetching odds for sport {sport}: {e}.")
 
+    async def _bounded_fetch(self, sem: asyncio.Semaphore, session: aiohttp.ClientSession, sport: str) -> None:
+        """
+        Fetches odds for a sport while holding the semaphore, so that at most `sem` requests are in flight at once.
+        """
+        async with sem:
+            await self.fetch_odds_async(session, sport)
+
+    async def _fetch_all_odds(self, sports: List[str]) -> None:
+        """
+        Fetches odds for all sports concurrently, bounded by a semaphore to avoid hammering the API.
+        """
+        sem = asyncio.Semaphore(10)
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(self._bounded_fetch(sem, session, sport) for sport in sports))
+
+    def _odds_frame(self) -> pd.DataFrame:
+        """
+        Builds the odds DataFrame in one shot from the parallel columns collected by fetch_odds_async.
+        """
+        return pd.DataFrame({
+            "sport": self._sport,
+            "home_team": self._home,
+            "away_team": self._away,
+            "bookmaker": self._book,
+            "home_odds": self._home_odds,
+            "away_odds": self._away_odds
+        })
+
     def run(self) -> None:
         """
         Main method to orchestrate the arbitrage bot:
         1. Fetch sports (using caching to reduce requests).
-        2. Fetch odds for each sport (and append into self.odds_data).
+        2. Fetch odds for all sports concurrently (and append into the odds columns).
         3. Compute arbitrage opportunities (using ArbitrageCalculator).
         4. Save arbitrage opportunities (if any) into a CSV file (arbitrage_opportunities.csv).
         """
@@ -157,24 +377,18 @@ class Fetch:
             print("No sports data available. Exiting.")
             return
 
-        for sport in sports:
-            print(f"Fetching odds for sport: {sport}...")
-            self.fetch_odds(sport)
-            # Sleep a little to avoid hitting rate limits (if any) on the API.
-            time.sleep(0.5)
+        print(f"Fetching odds for {len(sports)} sports concurrently...")
+        asyncio.run(self._fetch_all_odds(sports))
 
         print("Computing arbitrage opportunities...")
         arb_calc = ArbitrageCalculator()
-        arb_opportunities = []
-        # Arbitrarily, we compute arbitrage for the first 1000 odds (or less) to avoid an infinite loop.
-        for odd in self.odds_data[:1000]:
-            arb = arb_calc.compute_arbitrage([odd])
-            if arb:
-                arb_opportunities.append(arb)
+        # Compute arbitrage over the whole batch at once so that odds from different bookmakers are actually compared per event.
+        arb_opportunities = arb_calc.compute_all(self._odds_frame())
 
         if arb_opportunities:
-            df = pd.DataFrame(arb_opportunities)
-            df.to_csv("arbitrage_opportunities.csv", index=False)
+            # pyarrow's C++ CSV writer streams the table out much faster than pandas' to_csv.
+            table = pa.Table.from_pylist(arb_opportunities)
+            pacsv.write_csv(table, "arbitrage_opportunities.csv")
             print("Arbitrage opportunities saved into arbitrage_opportunities.csv.")
         else:
             print("No arbitrage opportunity found.")